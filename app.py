@@ -1,9 +1,20 @@
 import os
+import re
+import heapq
 import logging
+import mimetypes
+import secrets
+import tempfile
 import threading
 import time
-import uuid
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache, wraps
+import orjson
+from flask import Flask, Request, g, request, jsonify, render_template, send_from_directory
+from werkzeug.exceptions import NotFound
+from flask.json.provider import DefaultJSONProvider
+from flask_compress import Compress
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from werkzeug.middleware.proxy_fix import ProxyFix
@@ -11,7 +22,41 @@ from audio_processor import AudioProcessor
 
 logging.basicConfig(level=logging.INFO)
 
+class UploadRequest(Request):
+    # Multipart file parts are spooled into named temp files inside
+    # UPLOAD_FOLDER, so storing an upload is a rename instead of a copy.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_spools = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        spool = tempfile.NamedTemporaryFile(
+            dir=UPLOAD_FOLDER, prefix=".upload-", delete=False,
+            buffering=UPLOAD_SPOOL_BUFFER
+        )
+        self.upload_spools.append(spool)
+        return spool
+
+class ORJSONProvider(DefaultJSONProvider):
+    # jsonify/request.get_json backed by orjson's native encoder and parser.
+    # Dates and dataclasses are passed through to Flask's default() so they
+    # serialize exactly as with the stock provider (HTTP dates, not ISO 8601).
+    def dumps(self, obj, **kwargs):
+        option = (
+            orjson.OPT_NON_STR_KEYS
+            | orjson.OPT_PASSTHROUGH_DATETIME
+            | orjson.OPT_PASSTHROUGH_DATACLASS
+        )
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.request_class = UploadRequest
+app.json = ORJSONProvider(app)
 app.secret_key = os.environ.get("SESSION_SECRET", "production-secret")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
@@ -22,54 +67,313 @@ CORS(app)
 UPLOAD_FOLDER = "uploads"
 PROCESSED_FOLDER = os.path.join(UPLOAD_FOLDER, "processed")
 ALLOWED_EXTENSIONS = {"mp3", "wav", "flac", "aac", "m4a"}
+ALLOWED_RE = re.compile(
+    r"\.(?:%s)\Z" % "|".join(sorted(ALLOWED_EXTENSIONS)), re.IGNORECASE
+)
 MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB
+UPLOAD_SPOOL_BUFFER = 1024 * 1024  # coalesce multipart writes into 1MB syscalls
+# Spools are created 0600; saved uploads get the usual umask-based mode, as
+# file.save() would give them (read once at import, umask can't be queried)
+_umask = os.umask(0)
+os.umask(_umask)
+UPLOAD_FILE_MODE = 0o666 & ~_umask
+TASK_TTL = 3600  # seconds a task's state is kept
+MAX_TASKS = 2048  # in-memory store cap; the oldest tasks are evicted first
+REDIS_URL = os.environ.get("REDIS_URL")
+AUDIO_WORKERS = int(os.environ.get("AUDIO_WORKERS", os.cpu_count()))
+# Tasks accepted but not yet finished; further uploads get a 503
+MAX_PENDING_TASKS = int(os.environ.get("MAX_PENDING_TASKS", AUDIO_WORKERS * 4))
+# Internal nginx location aliasing PROCESSED_FOLDER, e.g. "/internal_processed/"
+X_ACCEL_REDIRECT_PREFIX = os.environ.get("X_ACCEL_REDIRECT_PREFIX")
 
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
 
+# Compress JSON/HTML responses; audio downloads are not in the mimetype list
+app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+app.config["COMPRESS_BR_LEVEL"] = 4
+app.config["COMPRESS_LEVEL"] = 4
+app.config["COMPRESS_MIN_SIZE"] = 256
+Compress(app)
+
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(PROCESSED_FOLDER, exist_ok=True)
 
-audio_processor = AudioProcessor(UPLOAD_FOLDER)
-processing_tasks = {}
+# Jobs run AUDIO_WORKERS at a time, so each FFT gets an even share of the cores
+audio_processor = AudioProcessor(
+    UPLOAD_FOLDER, fft_workers=max(1, os.cpu_count() // AUDIO_WORKERS)
+)
+
+# Known outputs, so /download answers from memory instead of a stat() call
+processed_files = set(os.listdir(PROCESSED_FOLDER))
+processed_lock = threading.Lock()
+
+# Audio jobs are CPU-bound NumPy/FFT work, so they run in a fixed-size
+# process pool instead of a thread per request. The pool is created on first
+# use: under gunicorn's preload_app the module is imported before forking,
+# and a pool built then would share its pipes between every worker.
+executor = None
+executor_lock = threading.Lock()
+task_slots = threading.BoundedSemaphore(MAX_PENDING_TASKS)
+
+# Cleared while the audio engine warms up; the pool waits on it so its
+# processes fork with librosa/numba already initialised
+warmup_done = threading.Event()
+warmup_done.set()
 
 # ================= HELPERS =================
 
-def allowed_file(filename):
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+def get_executor():
+    global executor
 
-# ================= HOME =================
+    warmup_done.wait()
 
-@app.route("/")
-def home():
-    return render_template("index.html")
+    with executor_lock:
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=AUDIO_WORKERS)
+        return executor
 
-# ================= SPLIT =================
+def discard_executor(pool):
+    # A pool whose child died (e.g. OOM-killed) rejects every later submit,
+    # so it is dropped and the next get_executor() call starts a fresh one
+    global executor
+
+    with executor_lock:
+        if executor is pool:
+            executor = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def start_warmup():
+    warmup_done.clear()
+    threading.Thread(target=warm_up, daemon=True).start()
 
-def process_split_task(task_id, filename):
+def warm_up():
     try:
-        processing_tasks[task_id]["status"] = "processing"
-        processing_tasks[task_id]["progress"] = 20
+        audio_processor.warmup()
+    finally:
+        warmup_done.set()
 
-        result = audio_processor.split_vocals_instruments(filename)
+    # Start the pool processes now rather than on the first upload
+    get_executor().submit(os.getpid)
 
-        processing_tasks[task_id]["progress"] = 70
+def limit_pending_tasks(view):
+    # Claims a task slot before the upload is read. The slot passes to the
+    # task once submit_task queues it, and is given back here otherwise.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not task_slots.acquire(blocking=False):
+            return jsonify({"error": "Server busy, try again later"}), 503
 
-        vocal_mp3 = audio_processor.convert_to_mp3(result["vocals"])
-        instrumental_mp3 = audio_processor.convert_to_mp3(result["instruments"])
+        try:
+            return view(*args, **kwargs)
+        finally:
+            if not g.get("task_submitted"):
+                task_slots.release()
 
-        processing_tasks[task_id]["status"] = "completed"
-        processing_tasks[task_id]["progress"] = 100
-        processing_tasks[task_id]["result"] = {
-            "vocal": vocal_mp3,
-            "instrumental": instrumental_mp3
-        }
+    return wrapper
 
+def allowed_file(filename):
+    return ALLOWED_RE.search(filename) is not None
+
+# Download names repeat across retries and clients, so the pure-Python
+# sanitizer runs once per distinct name instead of once per request
+cached_secure_filename = lru_cache(maxsize=4096)(secure_filename)
+
+def add_processed_files(names):
+    with processed_lock:
+        processed_files.update(names)
+
+def is_processed_file(name):
+    if name in processed_files:
+        return True
+
+    # Outputs written by another worker process are indexed on first miss
+    if os.path.isfile(os.path.join(PROCESSED_FOLDER, name)):
+        add_processed_files([name])
+        return True
+
+    return False
+
+def save_upload(file, filepath):
+    spool = file.stream
+
+    if isinstance(getattr(spool, "name", None), str):
+        spool.close()
+        os.chmod(spool.name, UPLOAD_FILE_MODE)
+        os.replace(spool.name, filepath)
+    else:
+        file.save(filepath)
+
+@app.teardown_request
+def discard_upload_spools(exc):
+    # Remove spools of uploads that were rejected before being saved
+    for spool in request.upload_spools:
+        spool.close()
+        try:
+            os.remove(spool.name)
+        except FileNotFoundError:
+            pass
+
+# ================= TASK STORE =================
+
+# With REDIS_URL set, task state lives in Redis (one hash per task with a
+# TTL) so it survives restarts and is shared by every gunicorn worker.
+# Otherwise it falls back to an in-process dict.
+#
+# Updates only apply while the task's hash still exists, so one landing after
+# the TTL lapsed can't recreate the task as a partial hash with a fresh TTL.
+# KEYS[1] is the task key, ARGV[1] the TTL, then field/value pairs.
+UPDATE_TASK_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+if REDIS_URL:
+    import redis
+    redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    update_task_script = redis_client.register_script(UPDATE_TASK_SCRIPT)
+else:
+    redis_client = None
+
+# The in-process store is striped over TASK_SHARDS dicts, each behind its own
+# lock, so polls and pipeline updates for different tasks don't contend
+TASK_SHARDS = 16
+task_shards = [({}, threading.Lock()) for _ in range(TASK_SHARDS)]
+task_expiry = []  # min-heap of (expires_at, task_id) for the in-process store
+task_expiry_lock = threading.Lock()
+
+def _task_key(task_id):
+    return f"task:{task_id}"
+
+def _task_shard(task_id):
+    return task_shards[hash(task_id) % TASK_SHARDS]
+
+def _write_task(task_id, fields):
+    key = _task_key(task_id)
+    mapping = {name: orjson.dumps(value) for name, value in fields.items()}
+    pipe = redis_client.pipeline()
+    pipe.hset(key, mapping=mapping)
+    pipe.expire(key, TASK_TTL)
+    pipe.execute()
+
+def create_task(task_id, fields):
+    if redis_client:
+        _write_task(task_id, fields)
+        return
+
+    tasks, lock = _task_shard(task_id)
+    with lock:
+        tasks[task_id] = dict(fields)
+
+    with task_expiry_lock:
+        heapq.heappush(task_expiry, (time.time() + TASK_TTL, task_id))
+
+    expire_tasks()
+
+def update_task(task_id, **fields):
+    if redis_client:
+        args = [TASK_TTL]
+        for name, value in fields.items():
+            args += [name, orjson.dumps(value)]
+        update_task_script(keys=[_task_key(task_id)], args=args)
+        return
+
+    tasks, lock = _task_shard(task_id)
+    with lock:
+        task = tasks.get(task_id)
+        if task is not None:
+            task.update(fields)
+
+def expire_tasks():
+    # Redis expires keys itself; locally only the due heap entries are popped,
+    # plus the oldest ones while the store is over MAX_TASKS. Every task has
+    # exactly one heap entry, so the heap's length is the task count.
+    if redis_client:
+        return
+
+    now = time.time()
+    expired = []
+    with task_expiry_lock:
+        while task_expiry and (task_expiry[0][0] <= now or len(task_expiry) > MAX_TASKS):
+            expired.append(heapq.heappop(task_expiry)[1])
+
+    for task_id in expired:
+        tasks, lock = _task_shard(task_id)
+        with lock:
+            tasks.pop(task_id, None)
+
+def get_task(task_id):
+    if redis_client:
+        stored = redis_client.hgetall(_task_key(task_id))
+        return {name: orjson.loads(value) for name, value in stored.items()}
+
+    # A task past its TTL reads as missing even before expire_tasks() pops
+    # it, so polls only ever take their own shard's lock
+    now = time.time()
+    tasks, lock = _task_shard(task_id)
+    with lock:
+        task = tasks.get(task_id)
+        if task is None or task.get("created_at", now) + TASK_TTL <= now:
+            return {}
+        return dict(task)
+
+# ================= PIPELINE =================
+
+# Jobs decode, process and encode their MP3 outputs inside the pool, so the
+# serving process only records the outcome when a job finishes
+def submit_task(task_id, progress, fn, *args):
+    update_task(task_id, status="processing", progress=progress)
+    pool = get_executor()
+    try:
+        future = pool.submit(fn, *args)
+    except BrokenProcessPool:
+        discard_executor(pool)
+        pool = get_executor()
+        future = pool.submit(fn, *args)
+    g.task_submitted = True
+    future.add_done_callback(lambda f: finish_task(task_id, f, pool))
+
+def finish_task(task_id, future, pool):
+    task_slots.release()
+
+    try:
+        result = future.result()
+    except BrokenProcessPool:
+        discard_executor(pool)
+        update_task(
+            task_id, status="failed",
+            error="Audio worker process crashed (possibly out of memory), please retry"
+        )
+        return
     except Exception as e:
-        processing_tasks[task_id]["status"] = "failed"
-        processing_tasks[task_id]["error"] = str(e)
+        update_task(task_id, status="failed", error=str(e))
+        return
+
+    add_processed_files(result.values())
+    update_task(task_id, status="completed", progress=100, result=result)
+
+# ================= HOME =================
+
+@app.route("/")
+def home():
+    return render_template("index.html")
+
+# ================= SPLIT =================
+
+def process_split_task(filename):
+    result = audio_processor.split_vocals_instruments(filename)
+
+    return {
+        "vocal": result["vocals"],
+        "instrumental": result["instruments"]
+    }
 
 @app.route("/split", methods=["POST"])
+@limit_pending_tasks
 def split_audio():
     try:
         if "file" not in request.files:
@@ -85,24 +389,19 @@ def split_audio():
 
         filename = secure_filename(file.filename)
         filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
+        save_upload(file, filepath)
 
-        task_id = str(uuid.uuid4())
+        task_id = secrets.token_hex(16)
 
-        processing_tasks[task_id] = {
+        create_task(task_id, {
             "status": "queued",
             "progress": 0,
             "filename": filename,
             "type": "split",
             "created_at": time.time()
-        }
+        })
 
-        thread = threading.Thread(
-            target=process_split_task,
-            args=(task_id, filename)
-        )
-        thread.daemon = True
-        thread.start()
+        submit_task(task_id, 20, process_split_task, filename)
 
         return jsonify({
             "task_id": task_id,
@@ -114,63 +413,57 @@ def split_audio():
 
 # ================= EFFECT =================
 
-def process_effect_task(task_id, filename, effect, intensity):
-    try:
-        processing_tasks[task_id]["status"] = "processing"
-        processing_tasks[task_id]["progress"] = 30
-
-        processed = audio_processor.apply_effect(filename, effect, intensity)
-
-        processing_tasks[task_id]["progress"] = 80
+def process_effect_task(filename, effect, intensity):
+    processed = audio_processor.apply_effect(filename, effect, intensity)
 
-        output_mp3 = audio_processor.convert_to_mp3(processed)
-
-        processing_tasks[task_id]["status"] = "completed"
-        processing_tasks[task_id]["progress"] = 100
-        processing_tasks[task_id]["result"] = {
-            "output": output_mp3
-        }
-
-    except Exception as e:
-        processing_tasks[task_id]["status"] = "failed"
-        processing_tasks[task_id]["error"] = str(e)
+    return {
+        "output": processed
+    }
 
 @app.route("/apply_fx", methods=["POST"])
+@limit_pending_tasks
 def apply_fx():
     try:
         if "file" not in request.files:
             return jsonify({"error": "No file provided"}), 400
 
         file = request.files["file"]
-        effect = request.form.get("effect")
-        intensity = int(request.form.get("intensity", 50))
+        effect = request.form.get("effect", "").lower()
+        intensity = request.form.get("intensity", "50")
 
         if file.filename == "":
             return jsonify({"error": "No file selected"}), 400
 
+        if not allowed_file(file.filename):
+            return jsonify({"error": "Unsupported format"}), 400
+
         if not effect:
             return jsonify({"error": "Effect required"}), 400
 
+        # Reject bad fields here rather than after the job is queued
+        if effect not in AudioProcessor.SUPPORTED_EFFECTS:
+            return jsonify({"error": "Unknown effect"}), 400
+
+        if not intensity.isdecimal() or int(intensity) > 100:
+            return jsonify({"error": "Intensity must be an integer from 0 to 100"}), 400
+
+        intensity = int(intensity)
+
         filename = secure_filename(file.filename)
         filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
+        save_upload(file, filepath)
 
-        task_id = str(uuid.uuid4())
+        task_id = secrets.token_hex(16)
 
-        processing_tasks[task_id] = {
+        create_task(task_id, {
             "status": "queued",
             "progress": 0,
             "filename": filename,
             "type": "effect",
             "created_at": time.time()
-        }
+        })
 
-        thread = threading.Thread(
-            target=process_effect_task,
-            args=(task_id, filename, effect, intensity)
-        )
-        thread.daemon = True
-        thread.start()
+        submit_task(task_id, 30, process_effect_task, filename, effect, intensity)
 
         return jsonify({
             "task_id": task_id,
@@ -184,7 +477,7 @@ def apply_fx():
 
 @app.route("/task/<task_id>")
 def get_task_status(task_id):
-    task = processing_tasks.get(task_id)
+    task = get_task(task_id)
 
     if not task:
         return jsonify({
@@ -205,18 +498,33 @@ def get_task_status(task_id):
 
 @app.route("/download/<filename>")
 def download_file(filename):
-    secure_name = secure_filename(filename)
-    file_path = os.path.join(PROCESSED_FOLDER, secure_name)
+    secure_name = cached_secure_filename(filename)
 
-    if not os.path.exists(file_path):
+    if not is_processed_file(secure_name):
         return jsonify({"error": "File not found"}), 404
 
-    return send_from_directory(PROCESSED_FOLDER, secure_name, as_attachment=True)
+    if X_ACCEL_REDIRECT_PREFIX:
+        # Let nginx sendfile() the output instead of streaming it through Python
+        mimetype = mimetypes.guess_type(secure_name)[0] or "application/octet-stream"
+        response = app.response_class(mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = X_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + secure_name
+        response.headers["Content-Disposition"] = f"attachment; filename={secure_name}"
+        return response
+
+    try:
+        return send_from_directory(PROCESSED_FOLDER, secure_name, as_attachment=True)
+    except NotFound:
+        # Removed from disk since it was indexed
+        with processed_lock:
+            processed_files.discard(secure_name)
+        return jsonify({"error": "File not found"}), 404
 
 # ================= STATUS =================
 
 @app.route("/status")
 def status():
+    expire_tasks()
+
     return jsonify({
         "status": "active",
         "service": "Lions Flute Audio FX API",
@@ -242,4 +550,5 @@ def internal_error(e):
 # ================= RUN =================
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 10000)))
\ No newline at end of file
+    start_warmup()
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 10000)))
@@ -6,82 +6,206 @@ Creates demo audio files for testing the application
 import numpy as np
 import soundfile as sf
 import os
-from scipy import signal
+from concurrent.futures import ProcessPoolExecutor
+from numba import njit
 import math
 
+# Sample offsets within a drum hit (the longest is 1000 samples); drum
+# envelopes, kick sines and hi-hat indices all slice this one buffer
+_DRUM_IDX = np.arange(1000)
+
+# Drum decay envelopes, shared by every render
+_KICK_ENV = np.exp(-_DRUM_IDX / 200).astype(np.float32)
+_ELECTRONIC_KICK_ENV = np.exp(-_DRUM_IDX[:500] / 100).astype(np.float32)
+_HIHAT_ENV = np.exp(-_DRUM_IDX[:100] / 20).astype(np.float32)
+
+
+# Sine oscillators advance by the rotation recurrence
+# s[i+1] = 2*cos(w)*s[i] - s[i-1] and are re-seeded from sin() this often,
+# before rounding drift can build up.
+_OSC_ANCHOR = 4096
+
+
+@njit(cache=True, fastmath=True)
+def _sin_at(i, freq, sr):
+    """sin(2*pi*freq*i/sr), with the phase wrapped to one cycle first."""
+    pos = i * freq / sr
+    return math.sin(2 * math.pi * (pos - math.floor(pos)))
+
+@njit(cache=True, fastmath=True)
+def _render_electronic(mix, sr, bass_freq, chord_freqs, lead_freq, reverb_delay):
+    """Render the electronic demo's synths and echo on top of the drums in mix.
+
+    Everything past the drums happens here in nopython mode, writing straight
+    into mix: oscillators in one pass, the swept lead in a second, and the
+    echo in place back to front so every tap still reads the dry signal.
+    Sines use the rotation recurrence rather than a sin() per sample.
+    """
+    n = mix.shape[0]
+
+    # Synthesizer pad (multiple sine waves with slight detuning)
+    partials = 2 * chord_freqs.shape[0]
+    freqs = np.empty(partials)
+    amps = np.empty(partials)
+    for j in range(chord_freqs.shape[0]):
+        freqs[2 * j], amps[2 * j] = chord_freqs[j], 0.2
+        freqs[2 * j + 1], amps[2 * j + 1] = chord_freqs[j] * 1.01, 0.1
+    coef = 2 * np.cos(2 * np.pi * freqs / sr)
+    cur = np.empty(partials)
+    prev = np.empty(partials)
+
+    for i in range(n):
+        # Electronic bass (sawtooth wave)
+        pos = i * bass_freq / sr
+        sample = 0.4 * (2 * (pos - math.floor(pos)) - 1)
+        for j in range(partials):
+            if i % _OSC_ANCHOR == 0:
+                cur[j] = _sin_at(i, freqs[j], sr)
+                prev[j] = _sin_at(i - 1, freqs[j], sr)
+            sample += amps[j] * cur[j]
+            cur[j], prev[j] = coef[j] * cur[j] - prev[j], cur[j]
+        mix[i] += sample
+
+    # Electronic lead (square wave) through a one-pole low-pass whose cutoff
+    # sweeps 1000 +/- 500 Hz at 0.5 Hz. The recurrence stays serial on
+    # purpose: the cumprod/cumsum expansion has to be re-anchored every few
+    # hundred samples before (1 - alpha) underflows, and even blocked it runs
+    # ~10x slower than this loop. Block-wise scipy.signal.lfilter with a
+    # per-block mean cutoff is ~3x slower as well, and audibly smears the
+    # sweep (errors up to 0.25).
+    lfo_coef = 2 * math.cos(2 * math.pi * 0.5 / sr)
+    lfo = lfo_prev = 0.0
+    prev = 0.0
+    for i in range(n):
+        if i % _OSC_ANCHOR == 0:
+            lfo = _sin_at(i, 0.5, sr)
+            lfo_prev = _sin_at(i - 1, 0.5, sr)
+        pos = i * lead_freq / sr
+        sample = 0.3 if pos - math.floor(pos) < 0.5 else -0.3
+        if i > 0:
+            cutoff = 1000 + 500 * lfo
+            alpha = min(2 * math.pi * cutoff / sr, 1.0)
+            sample = alpha * sample + (1 - alpha) * prev
+        prev = sample
+        mix[i] += sample
+        lfo, lfo_prev = lfo_coef * lfo - lfo_prev, lfo
+
+    # Reverb-like echo
+    for i in range(n - 1, reverb_delay - 1, -1):
+        mix[i] += 0.3 * mix[i - reverb_delay]
+    return mix
+
+@njit(cache=True, fastmath=True)
+def _normalize(x, target):
+    """Scale x in place so its peak magnitude equals target."""
+    peak = 0.0
+    for i in range(x.shape[0]):
+        a = abs(x[i])
+        if a > peak:
+            peak = a
+    scale = target / peak
+    for i in range(x.shape[0]):
+        x[i] *= scale
+    return x
+
+def _tone(freq, n, sample_rate, amplitude=1.0, start=0):
+    """Sine samples start..start+n of a tone, tiled from a one-period table.
+
+    Integer frequencies repeat every sample_rate / gcd(freq, sample_rate)
+    samples, so only that period is evaluated with np.sin; anything else
+    falls back to evaluating every sample. Phase is computed in float64 and
+    the samples are returned as float32.
+    """
+    if freq != int(freq):
+        idx = np.arange(start, start + n)
+        return (amplitude * np.sin(2 * np.pi * freq * idx / sample_rate)).astype(np.float32)
+
+    period = sample_rate // math.gcd(int(freq), sample_rate)
+    table = amplitude * np.sin(2 * np.pi * freq * np.arange(period) / sample_rate)
+    table = table.astype(np.float32)
+    offset = start % period
+    return np.tile(table, (offset + n) // period + 1)[offset:offset + n]
+
+def _write_stereo(filepath, mono, sample_rate, block_frames=1 << 16):
+    """Write a mono signal to both channels without building a stereo copy.
+
+    Samples go to libsndfile as float32 and are stored as 16-bit PCM.
+    """
+    mono = mono.astype(np.float32, copy=False)
+    with sf.SoundFile(filepath, 'w', sample_rate, 2, subtype='PCM_16') as f:
+        for start in range(0, len(mono), block_frames):
+            block = mono[start:start + block_frames]
+            f.write(np.broadcast_to(block[:, None], (len(block), 2)))
+
 def generate_demo_track(filename="demo_track.wav", duration=30, sample_rate=44100):
     """Generate a demo audio track with vocals and instruments."""
     
-    # Time array
-    t = np.linspace(0, duration, int(duration * sample_rate), False)
+    # Sample count
+    n = int(duration * sample_rate)
     
     # Create instrumental track (combination of different instruments)
     # Bass line (low frequency)
-    bass = 0.3 * np.sin(2 * np.pi * 80 * t) + 0.2 * np.sin(2 * np.pi * 120 * t)
+    bass = _tone(80, n, sample_rate, 0.3) + _tone(120, n, sample_rate, 0.2)
     
     # Rhythm guitar (mid frequencies)
     guitar_freq = 220  # A3
-    guitar = 0.4 * np.sin(2 * np.pi * guitar_freq * t) * (1 + 0.1 * np.sin(2 * np.pi * 4 * t))
+    guitar = _tone(guitar_freq, n, sample_rate, 0.4) * (1 + _tone(4, n, sample_rate, 0.1))
     
     # Lead melody (higher frequencies)
     melody_freqs = [440, 523, 659, 784, 659, 523, 440]  # A4, C5, E5, G5, E5, C5, A4
-    melody = np.zeros_like(t)
-    note_duration = duration / len(melody_freqs)
+    note_bounds = np.linspace(0, n, len(melody_freqs) + 1).astype(np.int64)
+    notes = list(zip(note_bounds[:-1], note_bounds[1:]))
     
-    for i, freq in enumerate(melody_freqs):
-        start_idx = int(i * note_duration * sample_rate)
-        end_idx = int((i + 1) * note_duration * sample_rate)
-        if end_idx > len(melody):
-            end_idx = len(melody)
-        melody[start_idx:end_idx] = 0.3 * np.sin(2 * np.pi * freq * t[start_idx:end_idx])
+    melody = np.concatenate([
+        _tone(freq, end - start, sample_rate, 0.3, start)
+        for freq, (start, end) in zip(melody_freqs, notes)
+    ])
     
     # Add some drums (percussive elements)
-    drum_beat = np.zeros_like(t)
+    drum_beat = np.zeros(n, dtype=np.float32)
     beat_interval = sample_rate // 2  # 2 beats per second
-    for i in range(0, len(t), beat_interval):
-        if i + 1000 < len(t):
-            # Kick drum (low frequency burst)
-            drum_beat[i:i+1000] = 0.5 * np.exp(-np.arange(1000) / 200) * np.sin(2 * np.pi * 60 * np.arange(1000) / sample_rate)
-    
-    # Combine instrumental elements
-    instrumental = bass + guitar + melody + drum_beat
+    # Kick drum (low frequency burst), rendered once and copied per beat
+    kick = 0.5 * _KICK_ENV * np.sin(2 * np.pi * 60 * _DRUM_IDX / sample_rate).astype(np.float32)
+    for i in range(0, n, beat_interval):
+        if i + 1000 < n:
+            drum_beat[i:i+1000] = kick
+    
+    # Combine instrumental elements (accumulated in place in the bass buffer)
+    instrumental = bass
+    instrumental += guitar
+    instrumental += melody
+    instrumental += drum_beat
     
     # Create vocal track (more focused in mid frequencies)
     vocal_freqs = [330, 370, 415, 466, 415, 370, 330]  # Vocal melody
-    vocals = np.zeros_like(t)
-    
-    for i, freq in enumerate(vocal_freqs):
-        start_idx = int(i * note_duration * sample_rate)
-        end_idx = int((i + 1) * note_duration * sample_rate)
-        if end_idx > len(vocals):
-            end_idx = len(vocals)
-        
-        # Add harmonics to make it more voice-like
-        fundamental = 0.4 * np.sin(2 * np.pi * freq * t[start_idx:end_idx])
-        harmonic2 = 0.2 * np.sin(2 * np.pi * freq * 2 * t[start_idx:end_idx])
-        harmonic3 = 0.1 * np.sin(2 * np.pi * freq * 3 * t[start_idx:end_idx])
-        
-        vocals[start_idx:end_idx] = fundamental + harmonic2 + harmonic3
+    
+    # Add harmonics to make it more voice-like
+    vocal_harmonics = [(1, 0.4), (2, 0.2), (3, 0.1)]
+    vocals = np.concatenate([
+        sum(_tone(freq * h, end - start, sample_rate, amp, start) for h, amp in vocal_harmonics)
+        for freq, (start, end) in zip(vocal_freqs, notes)
+    ])
     
     # Add some vibrato to vocals
-    vibrato = 1 + 0.05 * np.sin(2 * np.pi * 5 * t)  # 5 Hz vibrato
-    vocals = vocals * vibrato
+    vibrato = 1 + _tone(5, n, sample_rate, 0.05)  # 5 Hz vibrato
+    vocals *= vibrato
     
     # Combine vocals and instrumental
-    mixed_audio = 0.7 * instrumental + 0.8 * vocals
+    mixed_audio = instrumental
+    mixed_audio *= 0.7
+    vocals *= 0.8
+    mixed_audio += vocals
     
     # Normalize to prevent clipping
-    mixed_audio = mixed_audio / np.max(np.abs(mixed_audio)) * 0.8
-    
-    # Save as stereo (duplicate mono to both channels)
-    stereo_audio = np.column_stack((mixed_audio, mixed_audio))
+    _normalize(mixed_audio, 0.8)
     
     # Ensure uploads directory exists
     upload_dir = "uploads"
     os.makedirs(upload_dir, exist_ok=True)
     
     filepath = os.path.join(upload_dir, filename)
-    sf.write(filepath, stereo_audio, sample_rate)
+    # Save as stereo (duplicate mono to both channels)
+    _write_stereo(filepath, mixed_audio, sample_rate)
     
     print(f"Generated demo track: {filepath}")
     print(f"Duration: {duration} seconds")
@@ -91,81 +215,56 @@ def generate_demo_track(filename="demo_track.wav", duration=30, sample_rate=4410
     return filepath
 
 def generate_multiple_demos():
-    """Generate multiple demo files for testing."""
-    
-    # Short demo (10 seconds)
-    generate_demo_track("demo_short.wav", duration=10)
-    
-    # Medium demo (30 seconds) 
-    generate_demo_track("demo_medium.wav", duration=30)
-    
-    # Different style - electronic
-    generate_electronic_demo("demo_electronic.wav", duration=20)
+    """Generate multiple demo files for testing, one process per file."""
+    
+    with ProcessPoolExecutor(max_workers=3) as executor:
+        futures = [
+            # Short demo (10 seconds)
+            executor.submit(generate_demo_track, "demo_short.wav", duration=10),
+            # Medium demo (30 seconds)
+            executor.submit(generate_demo_track, "demo_medium.wav", duration=30),
+            # Different style - electronic
+            executor.submit(generate_electronic_demo, "demo_electronic.wav", duration=20),
+        ]
+        return [future.result() for future in futures]
 
 def generate_electronic_demo(filename="demo_electronic.wav", duration=20, sample_rate=44100):
     """Generate an electronic music demo."""
     
-    t = np.linspace(0, duration, int(duration * sample_rate), False)
-    
-    # Electronic bass (sawtooth wave)
-    bass_freq = 55  # A1
-    bass = 0.4 * signal.sawtooth(2 * np.pi * bass_freq * t)
-    
-    # Synthesizer pad (multiple sine waves with slight detuning)
-    pad = np.zeros_like(t)
-    chord_freqs = [220, 277, 330]  # A minor chord
-    for freq in chord_freqs:
-        pad += 0.2 * np.sin(2 * np.pi * freq * t)
-        pad += 0.1 * np.sin(2 * np.pi * (freq * 1.01) * t)  # Slight detune
-    
-    # Electronic lead (square wave with filter sweep)
-    lead_freq = 440
-    lead = 0.3 * signal.square(2 * np.pi * lead_freq * t)
-    
-    # Add filter sweep effect
-    cutoff_freq = 1000 + 500 * np.sin(2 * np.pi * 0.5 * t)
-    for i in range(len(lead)):
-        if i > 0:
-            # Simple low-pass filter
-            alpha = 2 * np.pi * cutoff_freq[i] / sample_rate
-            if alpha > 1:
-                alpha = 1
-            lead[i] = alpha * lead[i] + (1 - alpha) * lead[i-1]
+    n = int(duration * sample_rate)
     
     # Electronic drums
-    drums = np.zeros_like(t)
+    drums = np.zeros(n, dtype=np.float32)
     beat_interval = sample_rate // 4  # 4 beats per second
-    for i in range(0, len(t), beat_interval):
-        if i + 500 < len(t):
-            # Electronic kick
-            drums[i:i+500] = 0.6 * np.exp(-np.arange(500) / 100) * np.sin(2 * np.pi * 80 * np.arange(500) / sample_rate)
-        
-        # Hi-hat on off-beats
-        if i + beat_interval//2 + 100 < len(t):
-            hihat_start = i + beat_interval//2
-            drums[hihat_start:hihat_start+100] = 0.3 * np.random.normal(0, 1, 100) * np.exp(-np.arange(100) / 20)
-    
-    # Combine all elements
-    electronic_mix = bass + pad + lead + drums
-    
-    # Add some reverb-like effect
+    # Electronic kick and hi-hat decay, rendered once; only the noise is per hit
+    kick = 0.6 * _ELECTRONIC_KICK_ENV * np.sin(2 * np.pi * 80 * _DRUM_IDX[:500] / sample_rate).astype(np.float32)
+    hihat_env = 0.3 * _HIHAT_ENV
+    for i in range(0, n, beat_interval):
+        if i + 500 < n:
+            drums[i:i+500] = kick
+    
+    # Hi-hat on off-beats, with the noise for every hit drawn in one call
+    hihat_starts = np.arange(beat_interval//2, n - 100, beat_interval)
+    hihat_noise = np.random.normal(0, 1, (len(hihat_starts), 100))
+    drums[hihat_starts[:, None] + _DRUM_IDX[:100]] = hihat_noise * hihat_env
+    
+    # Bass, pad, swept lead and reverb, mixed over the drums in one kernel
+    bass_freq = 55  # A1
+    chord_freqs = np.array([220, 277, 330], dtype=np.float64)  # A minor chord
+    lead_freq = 440
     reverb_delay = int(0.1 * sample_rate)  # 100ms delay
-    reverb_audio = np.zeros_like(electronic_mix)
-    reverb_audio[reverb_delay:] = electronic_mix[:-reverb_delay] * 0.3
-    electronic_mix = electronic_mix + reverb_audio
+    electronic_mix = _render_electronic(drums, sample_rate, bass_freq, chord_freqs, lead_freq, reverb_delay)
     
     # Normalize
-    electronic_mix = electronic_mix / np.max(np.abs(electronic_mix)) * 0.8
-    
-    # Convert to stereo
-    stereo_audio = np.column_stack((electronic_mix, electronic_mix))
+    _normalize(electronic_mix, 0.8)
     
     # Ensure uploads directory exists
     upload_dir = "uploads"
     os.makedirs(upload_dir, exist_ok=True)
     
     filepath = os.path.join(upload_dir, filename)
-    sf.write(filepath, stereo_audio, sample_rate)
+    # Save as stereo (duplicate mono to both channels)
+    _write_stereo(filepath, electronic_mix, sample_rate)
     
     print(f"Generated electronic demo: {filepath}")
     return filepath
@@ -0,0 +1,31 @@
+"""
+Gunicorn settings for Lions Flute
+Loaded automatically when gunicorn starts from the project root
+"""
+
+import os
+import sys
+
+# Import the app (librosa, scipy, numba) once in the master so workers share
+# those pages copy-on-write instead of each paying the import on boot.
+# Not with --reload (the dev workflow): a preloaded master would keep forking
+# reloaded workers from the old code.
+reload_requested = "--reload" in sys.argv + os.environ.get("GUNICORN_CMD_ARGS", "").split()
+preload_app = not reload_requested
+
+# Task state is only shared between workers through Redis; without it a
+# poll must reach the worker that created the task, so run a single one
+workers = int(os.environ.get(
+    "WEB_CONCURRENCY", os.cpu_count() if os.environ.get("REDIS_URL") else 1
+))
+worker_class = "gthread"
+threads = 8
+
+# Split the cores between the workers' audio process pools
+os.environ.setdefault("AUDIO_WORKERS", str(max(1, os.cpu_count() // workers)))
+
+def post_fork(server, worker):
+    # Warm up in each worker: a thread started in the preloaded master
+    # would not survive the fork
+    from app import start_warmup
+    start_warmup()
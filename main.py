@@ -1,4 +1,5 @@
-from app import app
+from app import app, start_warmup
 
 if __name__ == '__main__':
+    start_warmup()
     app.run(host='0.0.0.0', port=8080, debug=True)